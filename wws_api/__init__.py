@@ -1,4 +1,4 @@
 from .request_data import request_wws
-from .process_data import to_pyarrow, to_dict, to_json
+from .process_data import to_pyarrow, to_pyarrow_batches, to_dict, to_json
 
-__all__ = ['request_wws', 'to_pyarrow', 'to_dict', 'to_json']
+__all__ = ['request_wws', 'to_pyarrow', 'to_pyarrow_batches', 'to_dict', 'to_json']
@@ -1,11 +1,32 @@
 import re
 import json
+import functools
+from collections import namedtuple
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator
 import xmltodict
 from lxml import etree
 import pyarrow as pa
 
+WD_NS = 'urn:com.workday/bsvc'
+WD = '{' + WD_NS + '}'  # Clark notation prefix, ie WD + 'ID' == '{urn:com.workday/bsvc}ID'
+WD_TYPE = WD + 'type'
+NAMESPACES = {'wd': WD_NS}
 
-def to_pyarrow(responses: list | tuple, start_tag: str, tags: list, allow_collections: bool = False) -> pa.Table:
+# TAG PROGRAM OPS, SEE _compile_tag_program
+_TagOp = namedtuple('_TagOp', ['kind', 'xpath', 'name', 'extra'])
+_NESTED, _ALL, _ATTRIBUTE, _OR, _TAG = range(5)
+
+# COLUMN RENAME FOR PREDICATES, ie "ID[@wd:type='Ledger_Account_ID']" -> Ledger_Account_ID
+_RENAME_RE = re.compile(r"=['\"]?([^]'\"]+)['\"]?\]")
+
+# COLUMNS (AFTER RENAME) WITH FEW DISTINCT VALUES, STORED AS DICTIONARY ARRAYS. ADD TO THIS SET TO ENCODE OTHER COLUMNS.
+DICT_ENCODED_COLUMNS = {'Journal_Source_ID', 'Ledger_Account_ID', 'Cost_Center_Reference_ID'}
+
+
+def to_pyarrow(responses: list | tuple, start_tag: str, tags: list, allow_collections: bool = False,
+               max_workers: int | None = 1) -> pa.Table:
     """
     High-level function to extract data from xml responses.
     Combine all xml responses into one list starting from start_tag. Extract tags from xml and load to pyarrow table..
@@ -14,7 +35,11 @@ def to_pyarrow(responses: list | tuple, start_tag: str, tags: list, allow_collec
     :param start_tag: str, starting tag to search for in xml. Should be the tag closest to the data you want to extract.
     :param tags: list, list of tags nested in start tag to extract from xml.
     :param allow_collections: allow xml values to be parsed into lists where number of values is greater than one.
-    :return: pyarrow Table with data extracted from xml responses..
+    :param max_workers: number of processes used to parse the responses, ``None`` uses all CPU cores. \
+    Default of 1 parses in the current process. When using more than one worker, call from under \
+    ``if __name__ == '__main__':`` on platforms that spawn processes (Windows, macOS).
+    :return: pyarrow Table with data extracted from xml responses.. Columns named in ``DICT_ENCODED_COLUMNS`` are \
+    dictionary encoded.
 
     **Tags Notes:**
 
@@ -138,33 +163,91 @@ def to_pyarrow(responses: list | tuple, start_tag: str, tags: list, allow_collec
     if len(responses) < 1:
         raise ValueError('No responses returned from API')
 
-    # CONVERT XML BYTES TO XML TREE AND COMBINE INTO ONE LIST
-    list_of_xml_tree = [etree.fromstring(xml).findall('.//wd:' + start_tag, namespaces={'wd': 'urn:com.workday/bsvc'})
-                        for xml in responses]
-    xml_list_by_start_tag = [xml for xml_tree in list_of_xml_tree for xml in xml_tree]
+    # XML PARSING AND EXTRACTION, ONE CHUNK OF ARROW COLUMNS PER RESPONSE
+    tags = _tags_to_xpath(tags)
+    parse_one = functools.partial(_parse_one, start_tag=start_tag, tags=tags, allow_collections=allow_collections,
+                                  dict_encoded=frozenset(DICT_ENCODED_COLUMNS))
+    if max_workers == 1:
+        chunks = [parse_one(xml) for xml in responses]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            chunks = list(executor.map(parse_one, responses, chunksize=4))
+    columns = _concat_chunks(chunks)
 
-    # XML PARSING AND EXTRACTION
-    tags = ['./wd:' + tag.replace('>>', '/wd:') for tag in tags]
-    tags = [tag.replace('||', '||./wd:') for tag in tags]
-    ns = {'wd': 'urn:com.workday/bsvc'}
-    data = _pull_data(responses=xml_list_by_start_tag, tags=tags, ns=ns, allow_collections=allow_collections)
+    # BUILD TABLE WITH THE RENAMED COLUMN NAMES
+    new_columns = [_column_name(col) for col in columns]
+    return pa.Table.from_arrays(list(columns.values()), names=new_columns)
 
-    # CONVERT TO DATAFRAME AND RENAME COLUMNS
-    table = pa.Table.from_pylist(data)
 
-    # Rename logic
-    col_rename = {}
-    for col in table.column_names:
-        match = re.search(r"=(.*?)\]", col)
-        if match:
-            col_rename[col] = match.group(1).replace("'", '')
-        elif '/wd:' in col:
-            col_rename[col] = col.split('/wd:')[-1]
+def to_pyarrow_batches(responses: list | tuple, start_tag: str, tags: list, allow_collections: bool = False,
+                       batch_size: int = 10_000, schema: pa.Schema = None) -> Iterator[pa.RecordBatch]:
+    """
+    Pulls the same rows as :py:func:`to_pyarrow` but yields pyarrow RecordBatches of up to batch_size rows while the
+    responses are parsed, so only one batch is held in memory. Useful to write large pulls straight to parquet.
+    See :py:func:`to_pyarrow` for the tags syntax.
 
-    # Apply renaming
-    new_columns = [col_rename.get(name, name) for name in table.column_names]
-    renamed_table = table.rename_columns(new_columns)
-    return renamed_table
+    The columns differ from :py:func:`to_pyarrow`, which only has the columns found in the responses in the order
+    they first show up. Every batch has a column for each tag in the order of tags (all null if never found) so the
+    schema is the same from the first batch.
+    Columns from ``'~'`` tags can't be known up front and are added when they first show up, and with
+    allow_collections a column that is all null in a batch is typed as string instead of a list. Pass schema to
+    get the same columns and types in every batch in those cases.
+
+    :param responses: list, list of xml responses from :py:func:`request_wws <pacs_data_etl.api.workday.wws.request_wws>`.
+    :param start_tag: str, starting tag to search for in xml. Should be the tag closest to the data you want to extract.
+    :param tags: list, list of tags nested in start tag to extract from xml.
+    :param allow_collections: allow xml values to be parsed into lists where number of values is greater than one.
+    :param batch_size: int, maximum number of rows per batch.
+    :param schema: pyarrow Schema, (renamed) columns and types of each batch. Columns not in the schema are dropped.
+    :return: generator of pyarrow RecordBatches.
+
+    Example
+
+    .. code-block:: python
+
+        import pyarrow.parquet as pq
+
+        writer = None
+        for batch in wws.to_pyarrow_batches(responses, start_tag='Journal_Entry_Data', tags=tags):
+            if writer is None:
+                writer = pq.ParquetWriter('journals.parquet', batch.schema)
+            writer.write_batch(batch)
+        writer.close()
+
+    With ``'~'`` tags or allow_collections, pass the schema so later batches can't change it
+
+    .. code-block:: python
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([('Journal_Number', pa.string()), ('Memo', pa.list_(pa.string()))])
+        with pq.ParquetWriter('journals.parquet', schema) as writer:
+            for batch in wws.to_pyarrow_batches(responses, start_tag='Journal_Entry_Data', tags=tags,
+                                                allow_collections=True, schema=schema):
+                writer.write_batch(batch)
+
+    """
+    # CHECK IF RESPONSES IS EMPTY
+    if len(responses) < 1:
+        raise ValueError('No responses returned from API')
+
+    tags = _tags_to_xpath(tags)
+    program = _compile_tag_program(tags)
+    elements = _iter_start_elements(responses=responses, start_tag=start_tag)
+    rows = _pull_data(responses=elements, program=program, allow_collections=allow_collections)
+    for columns in _collect_columns(rows, batch_size=batch_size, names=_program_columns(program)):
+        names = [_column_name(col) for col in columns]
+        if schema is None:
+            arrays = [_to_array(values, dictionary=name in DICT_ENCODED_COLUMNS)
+                      for name, values in zip(names, columns.values())]
+            yield pa.RecordBatch.from_arrays(arrays, names=names)
+        else:
+            # BUILD EACH COLUMN AS THE SCHEMA TYPE, COLUMNS NOT FOUND IN THIS BATCH ARE ALL NULL
+            by_name = dict(zip(names, columns.values()))
+            num_rows = len(next(iter(columns.values()), ()))
+            arrays = [_to_schema_array(by_name.get(field.name, [None] * num_rows), field.type) for field in schema]
+            yield pa.RecordBatch.from_arrays(arrays, schema=schema)
 
 
 def to_dict(responses: tuple | list, max_num: int = None) -> list:
@@ -224,45 +307,48 @@ def to_json(responses: tuple, file_name: str, max_num: int = None) -> None:
         print(f'Saved {file_name}')
 
 
-def _pull_data(responses: list, tags: list, ns: dict, high_level_tags: dict = None, allow_collections: bool = False) -> list:
+def _pull_data(responses: Iterator[etree._Element], program: list, allow_collections: bool = False) -> Iterator[dict]:
     """
-    Pull and organize XML data into a list of dictionaries to be converted to DataFrame.
+    Pull and organize XML data into dictionaries (one per row) to be converted to DataFrame.
 
     #. Loop through all elements in API responses.
-    #. In each loop, check the element for existence of each tag parameter.
+    #. In each loop, run the tag program from :py:func:`_compile_tag_program` against the element.
+    #. Nested (``'*'``) tags push their elements on a stack and run the rest of the program against each of them, \
+    so deeply nested data does not recurse.
 
-    :param responses: list, list of xml responses
-    :param tags: list, list of tags to pull from xml
-    :param ns: dict, namespace for xml
-    :param high_level_tags: dict, dictionary of high level tags to add to each row
+    :param responses: iterable of xml elements, see :py:func:`_iter_start_elements`
+    :param program: list, tag program from :py:func:`_compile_tag_program`
     :param allow_collections: allow xml values to be parsed into lists where number of values is greater than one
-    :return: list, list of dictionaries with data from xml
+    :return: generator of dictionaries with data from xml
     """
-    row_list = []
-    # LOOP THROUGH XML LIST
-    for element in responses:
-        # HIGH LEVEL TAGS USED FOR RECURSION
-        added_to_list = False
-        if high_level_tags is not None:
-            row_dict = high_level_tags.copy()
-        else:
-            row_dict = {}
+    ns = NAMESPACES
+    # STACK OF (ELEMENTS TO PROCESS, PROGRAM INDEX TO START FROM, HIGH LEVEL TAGS TO ADD TO EACH ROW)
+    stack = [(iter(responses), 0, None)]
+    while stack:
+        elements, start, high_level_tags = stack[-1]
+        element = next(elements, None)
+        if element is None:
+            stack.pop()
+            continue
+
+        # ONLY THIS ELEMENT'S TAGS, HIGH LEVEL TAGS ARE MERGED IN ONCE AFTER ALL TAGS ARE PULLED
+        row_dict = {}
+        nested = None
+        # '~' TAGS ONLY ADD THEIR OWN ROWS, THE ELEMENT'S ROW IS NOT KEPT
+        keep_row = True
+        # (COLUMN NAME, VALUES, TAGS PULLED SO FAR) FOR TAGS WITH MORE THAN ONE ELEMENT, EACH VALUE BECOMES ITS OWN ROW.
+        # COLUMN NAME IS NONE FOR '~' TAGS WHERE THE VALUES ARE DICTIONARIES OF COLUMNS.
+        spread = []
         # PULL EACH TAG FROM XML ELEMENT
-        for tag in tags:
-            # IF MARKED WITH '*' THEN FINDALL TO GO A LEVEL DEEPER AND GO TO NEXT TAG TO SEARCH ELEMENTS
-            if '*' in tag:
-                elements = element.findall('./' + tag.replace('*', ''), namespaces=ns)
-                nested_tags = _next_tags(tags=tags, curr_tag=tag)
-                sub_list = pull_data(responses=elements,
-                                     tags=nested_tags, ns=ns,
-                                     high_level_tags=row_dict,
-                                     allow_collections=allow_collections)
-                row_list.extend(sub_list)
-                added_to_list = True
+        for index in range(start, len(program)):
+            kind, xpath, name, extra = program[index]
+            # IF MARKED WITH '*' THEN GO A LEVEL DEEPER AND RUN THE REST OF THE PROGRAM ON EACH NESTED ELEMENT
+            if kind == _NESTED:
+                nested = (iter(xpath(element)), index + 1)
                 break
-            elif '~' in tag:
-                parent_path = tag.replace('~', '').strip()
-                elems = element.xpath(parent_path, namespaces=ns)
+            elif kind == _ALL:
+                keep_row = False
+                elems = xpath(element)
                 if len(elems) == 1:
                     elem = elems[0]
                     # Use recursive function to extract data without parent prefix
@@ -280,145 +366,334 @@ def _pull_data(responses: list, tags: list, ns: dict, high_level_tags: dict = No
                                     collected_data[k] = [v]
                         row_dict.update(collected_data)
                     else:
-                        sub_list = []
-                        for e in elems:
-                            row_d = row_dict.copy()
-                            nested_data = _extract_element_data(e, ns, prefix='')  # Set prefix to empty string
-                            row_d.update(nested_data)
-                            sub_list.append(row_d)
-                        row_list.extend(sub_list)
-                        added_to_list = True
+                        spread.append((None, [_extract_element_data(e, ns, prefix='') for e in elems], row_dict.copy()))
                 else:
                     # No elements found
-                    row_dict[tag] = None
-                added_to_list = True
+                    row_dict[name] = None
                 continue  # Proceed to next tag
+            elif kind == _ATTRIBUTE:
+                # ATTRIBUTE ON THE ELEMENT ITSELF, OTHERWISE SEARCH FOR IT WITH XPATH
+                elem = element.get(extra)
+                if elem is None:
+                    elem = xpath(element)
+                    row_dict.update({name: elem[0] if elem else None})
+                else:
+                    row_dict.update({name: elem})
+                continue
+
+            # Checks if there is an OR Clause in the tag
+            # Get element via xpath
+            if kind == _OR:
+                # FIRST ALTERNATIVE WITH ONE ELEMENT WINS, NOTHING IS ADDED IF NONE OF THEM MATCH
+                for alternative in xpath:
+                    elem = alternative(element)
+                    if len(elem) == 1:
+                        row_dict[extra] = elem[0].get(WD_TYPE)
+                        break
+                else:
+                    continue
             else:
-                # PULL TAG FROM XML ELEMENT - SHOULD ONLY BE ONE ELEMENT.
-                # RENAME TAG IF MARKED WITH '^^'
-                if '^^' in tag:
-                    tag, name = tag.split('^^')
+                # If no OR clause grab default tag.
+                elem = xpath(element)
+
+            # ADD ELEMENT TO ROW_DICT
+            if len(elem) == 1:
+                if hasattr(elem[0], 'text'):
+                    row_dict.update({name: elem[0].text})
                 else:
-                    name = tag
+                    row_dict.update({name: elem[0]})
 
-                # CHECK IF ATTRIBUTE
-                # ie Company_Data>>Contact_Data>>Address_Data>>@@Formatted_Address
-                # to capture data structure end point {'Address Data': '@wd:Formatted_Address'}
-                if '@@' in tag:
-                    tmp_tag = tag.replace('wd:@@', '@wd:')
-                    tag = tag.replace('@@', '')
-                    t = f"{{{ns.get('wd')}}}" + tag.replace('./wd:', '')
-                    elem = element.get(t)
-                    if elem is None:
-                        elem = element.xpath(tmp_tag, namespaces=ns)
-                        row_dict.update({name: elem[0] if elem else None})
+
+            # if there is more than one element
+            elif len(elem) > 1:
+                if allow_collections:  # lists are allowed in one cell instead of trying to make new rows
+                    if hasattr(elem[0], 'text'):
+                        row_dict[name] = [e.text for e in elem]
                     else:
-                        row_dict.update({name: elem})
+                        row_dict[name] = list(elem)
+                else:
+                    spread.append((name, [e.text for e in elem], row_dict.copy()))
+
+        if high_level_tags:
+            row_dict = {**high_level_tags, **row_dict}
+        if nested is not None:
+            stack.append((*nested, row_dict))
+
+        # ROWS ARE BUILT ONCE ALL TAGS ARE PULLED, EACH WITH THE TAGS PULLED BEFORE ITS MULTI ELEMENT TAG
+        if spread:
+            for spread_name, values, row_before in spread:
+                if high_level_tags:
+                    row_before = {**high_level_tags, **row_before}
+                if spread_name is None:
+                    for value in values:
+                        yield {**row_before, **value}
+                else:
+                    for value in values:
+                        yield {**row_before, spread_name: value}
+        elif nested is None and keep_row:
+            yield row_dict
 
-                    continue
 
-                elem = None
+def _parse_one(xml: bytes, start_tag: str, tags: list, allow_collections: bool = False,
+               dict_encoded: frozenset = frozenset()) -> dict:
+    """
+    Parse one xml response into arrow arrays keyed by (not yet renamed) column name.
+    Module level so it can be pickled into a :py:class:`ProcessPoolExecutor` worker, tags are compiled inside the worker.
 
+    :param xml: bytes, xml response
+    :param start_tag: str, starting tag to search for in xml
+    :param tags: list, tags already converted to xpath by :py:func:`to_pyarrow`
+    :param allow_collections: allow xml values to be parsed into lists where number of values is greater than one
+    :param dict_encoded: frozenset, renamed column names to dictionary encode (passed in so workers see user additions)
+    :return: dict, column name to pyarrow Array
+    """
+    elements = _iter_start_elements(responses=[xml], start_tag=start_tag)
+    rows = _pull_data(responses=elements, program=_compile_tag_program(tags), allow_collections=allow_collections)
+    columns = next(_collect_columns(rows))
+    return {name: _to_array(values, dictionary=_column_name(name) in dict_encoded) for name, values in columns.items()}
 
 
-                # Checks if the tag contains a wildcard.
-                if '%' in tag:
-                    xpath = []
-                    # splits it into multiple parts if an OR Statement is found.
-                    multi_tags = tag.split('||')
-                    for i in multi_tags:
-                        try:
-                            # Get the variables needed for the search function.
-                            xpath_to_search, search_part, end_of_path = i.split('%')
-                            search_term, data_type = search_part.split('?=')
-                            xpath_to_search = xpath_to_search.strip()
-                            search_term = search_term.strip()
-                            data_type = data_type.strip()
-                            end_of_path = end_of_path.strip()
-                        except ValueError as e:
-                            print(f"Error processing tag '{i}': {e}")
-                            continue
-
-                        # Different elements to search for.
-                        if data_type == 'type':
-                            xpath_expression = f"{xpath_to_search}ID[contains(translate(@wd:type, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), '{search_term.lower()}')]{end_of_path}"
-                            xpath.append(xpath_expression)
-                        elif data_type == 'text':
-                            xpath_expression = f"{xpath_to_search}ID[contains(translate(text(), 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), '{search_term.lower()}')]{end_of_path}"
-                            xpath.append(xpath_expression)
-                        elif data_type == 'tag':
-                            xpath_expression = f"{xpath_to_search}*[contains(translate(local-name(), 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), '{search_term.lower()}')]{end_of_path}"
-                            xpath.append(xpath_expression)
-                        else:
-                            print(f"Unknown data_type '{data_type}' in tag '{i}'")
-                            continue
-                    tag = '||'.join(xpath) # Joins the tag back if there were more than one.
-
-
-                # Checks if there is an OR Clause in the tag
-                # Get element via xpath
-                if '||' in tag:
-                    typename = tag.split('|=') # Grabs column name where it will store the value type
-                    tag = tag.replace('|=' + typename[1], '') # formats the tag without the rename
-                    for i in tag.split('||'):
-                        elem = element.xpath(i, namespaces=ns)
-                        if len(elem) == 1:
-                            elem_name = elem[0].get(f'{{{ns.get("wd")}}}type')
-                            row_dict.update({typename[1]: elem_name})
-                            break
-                else:
-                    # If no OR clause grab default tag.
-                    elem = element.xpath(tag, namespaces=ns)
+def _concat_chunks(chunks: list) -> dict:
+    """
+    Concatenate the per response arrays from :py:func:`_parse_one` into one array per column.
+    Columns missing from a chunk, or all null with a different type, are filled with nulls of the column type.
 
-                # ADD ELEMENT TO ROW_DICT
-                if len(elem) == 1:
-                    if hasattr(elem[0], 'text'):
-                        row_dict.update({name: elem[0].text})
-                    else:
-                        row_dict.update({name: elem[0]})
+    :param chunks: list, list of dicts of column name to pyarrow Array
+    :return: dict, column name to pyarrow Array
+    """
+    lengths = [len(next(iter(chunk.values()))) if chunk else 0 for chunk in chunks]
+    # ONE TYPE PER COLUMN. ALL NULL ARRAYS ARE TYPED AS STRING, SO THE TYPE COMES FROM THE FIRST CHUNK WITH VALUES
+    # (ie A LIST FOR COLLECTIONS) AND ONLY FALLS BACK TO AN ALL NULL CHUNK IF THE COLUMN HAS NO VALUES AT ALL
+    types = {}
+    all_null = {}
+    for chunk in chunks:
+        for name, array in chunk.items():
+            if name not in types or (all_null[name] and array.null_count < len(array)):
+                types[name] = array.type
+                all_null[name] = array.null_count == len(array)
+
+    return {name: pa.concat_arrays([chunk[name] if name in chunk and (chunk[name].type == col_type or
+                                                                      chunk[name].null_count < length)
+                                    else pa.nulls(length, type=col_type)
+                                    for chunk, length in zip(chunks, lengths)])
+            for name, col_type in types.items()}
+
+
+def _collect_columns(rows: Iterator[dict], batch_size: int = None, names: list = ()) -> Iterator[dict]:
+    """
+    Pivot rows from :py:func:`_pull_data` into column lists. Columns missing from a row are padded with None
+    so every list stays the same length.
+
+    :param rows: iterable of row dictionaries
+    :param batch_size: int, yield the columns every batch_size rows (columns carry over to the next batch). \
+    None yields all rows once.
+    :param names: list, column names to start with, so they are there even before (or if never) found in a row
+    :return: generator of dicts, column name to list of values
+    """
+    columns = {key: [] for key in names}
+    row_count = 0
+    for row in rows:
+        for key, value in row.items():
+            values = columns.get(key)
+            if values is None:
+                values = columns[key] = [None] * row_count
+            values.append(value)
+        row_count += 1
+        if len(row) != len(columns):
+            for values in columns.values():
+                if len(values) < row_count:
+                    values.append(None)
+        if row_count == batch_size:
+            yield columns
+            columns = {key: [] for key in columns}
+            row_count = 0
+    if row_count or batch_size is None:
+        yield columns
+
+
+def _program_columns(program: list) -> list:
+    """
+    Column names (not yet renamed) a tag program can add to a row, in program order.
+    Columns from ``'~'`` tags depend on the xml and are not included.
 
+    :param program: list, tag program from :py:func:`_compile_tag_program`
+    :return: list, column names
+    """
+    names = {}
+    for kind, _, name, extra in program:
+        if kind == _OR:
+            names[extra] = None
+        if kind in (_TAG, _OR, _ATTRIBUTE):
+            names[name] = None
+    return list(names)
 
-                # if there is more than one element
-                elif len(elem) > 1:
-                    if allow_collections:  # lists are allowed in one cell instead of trying to make new rows
-                        sub_list = []
-                        for e in elem:
-                            if hasattr(elem[0], 'text'):
-                                sub_list.append(e.text)
-                            else:
-                                sub_list.append(e)
 
-                        row_dict[name] = sub_list
-                    else:
-                        sub_list = []
-                        for e in elem:
-                            row_d = row_dict.copy()
-                            row_d.update({name: e.text})
-                            sub_list.append(row_d)
-                        row_list.extend(sub_list)
-                        added_to_list = True
+def _tags_to_xpath(tags: list) -> list:
+    """Convert the ``'>>'`` tags syntax to xpath relative to the start tag, ie ``'A>>B'`` -> ``'./wd:A/wd:B'``."""
+    tags = ['./wd:' + tag.replace('>>', '/wd:') for tag in tags]
+    return [tag.replace('||', '||./wd:') for tag in tags]
+
+
+def _to_array(values: list, dictionary: bool = False) -> pa.Array:
+    """
+    Build a string array for a column, falls back to type inference for collections (lists).
+
+    :param values: list, column values
+    :param dictionary: bool, dictionary encode the string array (for columns with few distinct values)
+    :return: pyarrow Array
+    """
+    try:
+        array = pa.array(values, type=pa.string())
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        return pa.array(values)
+    return array.dictionary_encode() if dictionary else array
+
+
+def _to_schema_array(values: list, data_type: pa.DataType) -> pa.Array:
+    """
+    Build a column as the given schema type. For list types single values are wrapped in a list, with
+    allow_collections an element with one match is a plain string that would otherwise be split into characters.
+
+    :param values: list, column values
+    :param data_type: pyarrow DataType, type of the column in the schema
+    :return: pyarrow Array
+    """
+    if pa.types.is_list(data_type) or pa.types.is_large_list(data_type):
+        values = [value if value is None or isinstance(value, list) else [value] for value in values]
+    return pa.array(values, type=data_type)
+
+
+def _column_name(col: str) -> str:
+    """Final column name for a tag, ie "./wd:Ledger_Account_Reference/wd:ID[@wd:type='Ledger_Account_ID']" -> Ledger_Account_ID"""
+    match = _RENAME_RE.search(col)
+    if match:
+        return match.group(1)
+    elif '/wd:' in col:
+        return col.split('/wd:')[-1]
+    return col
 
-        if not added_to_list:
-            row_list.append(row_dict)
 
-    return row_list
+def _iter_start_elements(responses: list | tuple, start_tag: str) -> Iterator[etree._Element]:
+    """
+    Stream start_tag elements from each xml response with iterparse instead of building the full tree.
+    Start tags nested in another start tag are yielded right after it once the outermost one is parsed, so elements
+    come out in document order. The outermost element is cleared (along with already processed siblings) once the
+    consumer moves on to the next one, so only one page is held in memory at a time.
+
+    :param responses: list, list of xml responses
+    :param start_tag: str, tag to yield elements for
+    :return: generator of start_tag elements in document order
+    """
+    tag = WD + start_tag
+    for xml in responses:
+        # ITERPARSE NEEDS BYTES, RESPONSES READ AS TEXT (ie FROM DISK) ARE ENCODED FIRST
+        if isinstance(xml, str):
+            xml = xml.encode()
+        depth = 0
+        for event, elem in etree.iterparse(BytesIO(xml), events=('start', 'end'), tag=tag):
+            if event == 'start':
+                depth += 1
+                continue
+            depth -= 1
+            # INNER START TAGS END FIRST, WAIT FOR THE OUTERMOST ONE SO NOTHING IS CLEARED WHILE IT IS STILL NEEDED
+            if depth:
+                continue
+            yield from elem.iter(tag)
+            elem.clear(keep_tail=True)
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
+
+def _compile_tag_program(tags: list) -> list:
+    """
+    Compile tags into a flat program of :py:class:`_TagOp` for :py:func:`_pull_data`.
+    Tag markers (``'*'``, ``'~'``, ``'^^'``, ``'@@'``, ``'%'``, ``'||'``, ``'|='``) are parsed and the xpath compiled once
+    here instead of for every element. A nested (``'*'``) op applies to all the ops after it.
+
+    :param tags: list, tags already converted to xpath by :py:func:`to_pyarrow`
+    :return: list, list of :py:class:`_TagOp`
+    """
+    program = []
+    for tag in tags:
+        if '*' in tag:
+            program.append(_TagOp(_NESTED, _compile_xpath(tag.replace('*', '')), tag, None))
+        elif '~' in tag:
+            program.append(_TagOp(_ALL, _compile_xpath(tag.replace('~', '').strip()), tag, None))
+        else:
+            # RENAME TAG IF MARKED WITH '^^'
+            if '^^' in tag:
+                tag, name = tag.split('^^')
+            else:
+                name = tag
+
+            if '@@' in tag:
+                # ie Company_Data>>Contact_Data>>Address_Data>>@@Formatted_Address
+                # to capture data structure end point {'Address Data': '@wd:Formatted_Address'}
+                attribute = WD + tag.replace('@@', '').replace('./wd:', '')
+                program.append(_TagOp(_ATTRIBUTE, _compile_xpath(tag.replace('wd:@@', '@wd:')), name, attribute))
+            else:
+                # WILDCARD SEARCH, JOINED BACK WITH '||' IF THERE WERE MORE THAN ONE
+                if '%' in tag:
+                    tag = '||'.join(_build_wildcard_xpath(tag))
+
+                if '||' in tag:
+                    typename = tag.split('|=')[1]  # column name where it will store the value type
+                    alternatives = [_compile_xpath(i) for i in tag.replace('|=' + typename, '').split('||')]
+                    program.append(_TagOp(_OR, alternatives, name, typename))
+                else:
+                    program.append(_TagOp(_TAG, _compile_xpath(tag), name, None))
+    return program
 
 
-def _next_tags(tags: list, curr_tag: str) -> list:
+@functools.lru_cache(maxsize=512)
+def _build_wildcard_xpath(tag: str) -> tuple:
     """
-    Get next tags to search for in xml. Used for nested elements.
+    Build the xpath for a wildcard (``'%'``) tag, one per ``'||'`` alternative.
+    ie ``'./wd:%start?=tag%'`` searches for any child tag containing "start" (case-insensitive).
+
+    :param tag: str, tag already converted to xpath by :py:func:`to_pyarrow`
+    :return: tuple, xpath expressions
     """
-    activated = False
-    tmp_tags = []
-    for tmp_tag in tags:
-        if activated:
-            tmp_tags.append(tmp_tag)
-        if tmp_tag == curr_tag and not activated:
-            activated = True
-    return tmp_tags
+    xpath = []
+    # splits it into multiple parts if an OR Statement is found.
+    for i in tag.split('||'):
+        try:
+            # Get the variables needed for the search function.
+            xpath_to_search, search_part, end_of_path = i.split('%')
+            search_term, data_type = search_part.split('?=')
+            xpath_to_search = xpath_to_search.strip()
+            search_term = search_term.strip()
+            data_type = data_type.strip()
+            end_of_path = end_of_path.strip()
+        except ValueError as e:
+            print(f"Error processing tag '{i}': {e}")
+            continue
+
+        # Different elements to search for.
+        if data_type == 'type':
+            xpath.append(f"{xpath_to_search}ID[contains(translate(@wd:type, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), '{search_term.lower()}')]{end_of_path}")
+        elif data_type == 'text':
+            xpath.append(f"{xpath_to_search}ID[contains(translate(text(), 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), '{search_term.lower()}')]{end_of_path}")
+        elif data_type == 'tag':
+            xpath.append(f"{xpath_to_search}*[contains(translate(local-name(), 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), '{search_term.lower()}')]{end_of_path}")
+        else:
+            print(f"Unknown data_type '{data_type}' in tag '{i}'")
+    return tuple(xpath)
+
+
+@functools.lru_cache(maxsize=512)
+def _compile_xpath(xpath: str) -> etree.XPath:
+    """Compile an xpath expression against the Workday namespace, cached by expression."""
+    return etree.XPath(xpath, namespaces=NAMESPACES)
 
 
-def _extract_element_data(element, ns, prefix='', max_length=63, existing_keys=None):
+@functools.lru_cache(maxsize=4096)
+def _localname(clark: str) -> str:
+    """Local name of a Clark notation tag or attribute name, cached since the same names repeat on every element."""
+    return clark.rsplit('}', 1)[-1] if clark[0] == '{' else clark
+
+
+def _extract_element_data(element, ns, prefix='', max_length=63):
     """
     Recursively extract text values from an XML element and its children.
 
@@ -426,34 +701,29 @@ def _extract_element_data(element, ns, prefix='', max_length=63, existing_keys=N
     :param ns: Namespace dictionary for XML parsing.
     :param prefix: A string prefix for key names to reflect hierarchy.
     :param max_length: Maximum length for keys (e.g., 63 for PostgreSQL).
-    :param existing_keys: A set to keep track of existing keys to ensure uniqueness.
     :return: A dictionary with extracted data.
     """
-    if existing_keys is None:
-        existing_keys = set()
     data = {}
     for child in element:
-        tag_name = etree.QName(child.tag).localname
+        tag_name = _localname(child.tag)
         key = f"{prefix}_{tag_name}" if prefix else tag_name
 
         # Shorten the key if necessary
-        original_key = key
-        key = _shorten_column_name(key, max_length=max_length)
-
-        existing_keys.add(key)
+        if len(key) > max_length:
+            key = _shorten_column_name(key, max_length=max_length)
 
         # Extract attributes
         for attr_name, attr_value in child.attrib.items():
-            attr_local_name = etree.QName(attr_name).localname
+            attr_local_name = _localname(attr_name)
             attr_key = f"{key}_{attr_local_name}"
             # Shorten the attribute key if necessary
-            attr_key = _shorten_column_name(attr_key, max_length=max_length)
-            existing_keys.add(attr_key)
+            if len(attr_key) > max_length:
+                attr_key = _shorten_column_name(attr_key, max_length=max_length)
             data[attr_key] = attr_value
 
         if len(child):  # If the child has its own children
             # Recursively extract data
-            child_data = _extract_element_data(child, ns, prefix=key, max_length=max_length, existing_keys=existing_keys)
+            child_data = _extract_element_data(child, ns, prefix=key, max_length=max_length)
             data.update(child_data)
         else:
             text_value = child.text
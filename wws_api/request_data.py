@@ -1,8 +1,47 @@
-import html
+import re
+import random
 import asyncio
+from io import BytesIO
 import aiohttp
 from lxml import etree
 
+# CONCURRENT REQUESTS TO WORKDAY, ALSO USED AS THE CONNECTION POOL SIZE
+MAX_CONCURRENT_REQUESTS = 32
+# RETRIES FOR THROTTLED (429) OR UNAVAILABLE (503) RESPONSES
+MAX_RETRIES = 5
+RETRY_STATUSES = (429, 503)
+
+_TOTAL_PAGES_RE = re.compile(rb'<wd:Total_Pages>(\d+)</wd:Total_Pages>')
+_TOTAL_PAGES_TAG = '{urn:com.workday/bsvc}Total_Pages'
+_PAGE_PLACEHOLDER_RE = re.compile(r'\{\{ page \}\}|\{ page \}')
+
+# SAME ESCAPES AS html.escape(text, quote=True) IN ONE PASS
+_ESCAPE_TABLE = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#x27;'})
+
+# SOAP ENVELOPE WITH CREDS, FILLED IN BY create_payload
+_ENVELOPE = """
+    <?xml version="1.0" encoding="utf-8"?>
+    <env:Envelope
+            xmlns:env="http://schemas.xmlsoap.org/soap/envelope/"
+            xmlns:xsd="http://www.w3.org/2001/XMLSchema"
+            xmlns:wsse="http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-secext-1.0.xsd">
+        <env:Header>
+            <wsse:Security env:mustUnderstand="1">
+                <wsse:UsernameToken>
+                    <wsse:Username>{username}</wsse:Username>
+                    <wsse:Password
+                            Type="http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-username-token-profile-1.0#PasswordText">
+                        {password}
+                    </wsse:Password>
+                </wsse:UsernameToken>
+            </wsse:Security>
+        </env:Header>
+        <env:Body>
+            {xml_body}
+        </env:Body>
+    </env:Envelope>
+    """.strip()
+
 
 def request_wws(url, username, password, xml_payload) -> list:
     """
@@ -36,34 +75,12 @@ def create_payload(username: str, password: str, xml_body: str) -> str:
     :param xml_body: Prepared XML payload request.
     :return: Full payload for API call.
     """
-    escaped_password = escape_html(password)
-    return f"""
-    <?xml version="1.0" encoding="utf-8"?>
-    <env:Envelope
-            xmlns:env="http://schemas.xmlsoap.org/soap/envelope/"
-            xmlns:xsd="http://www.w3.org/2001/XMLSchema"
-            xmlns:wsse="http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-secext-1.0.xsd">
-        <env:Header>
-            <wsse:Security env:mustUnderstand="1">
-                <wsse:UsernameToken>
-                    <wsse:Username>{username}</wsse:Username>
-                    <wsse:Password
-                            Type="http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-username-token-profile-1.0#PasswordText">
-                        {escaped_password}
-                    </wsse:Password>
-                </wsse:UsernameToken>
-            </wsse:Security>
-        </env:Header>
-        <env:Body>
-            {xml_body}
-        </env:Body>
-    </env:Envelope>
-    """.strip()
+    return _ENVELOPE.format(username=username, password=escape_html(password), xml_body=xml_body)
 
 
 def escape_html(text):
     """Encode special characters (<, >, &, etc.) to HTML-safe sequences."""
-    return html.escape(text)
+    return text.translate(_ESCAPE_TABLE)
 
 
 async def _generate_requests(url: str, xml_template: str) -> list:
@@ -79,19 +96,20 @@ async def _generate_requests(url: str, xml_template: str) -> list:
         .. code-example:: python
 
     """
-    payload = xml_template.replace('{{ page }}', str(1))
-    payload = payload.replace('{ page }', str(1))
+    # SPLIT THE TEMPLATE ON THE PAGE PLACEHOLDERS ONCE, EACH PAGE IS A JOIN OF THE ENCODED PARTS
+    template_parts = [part.encode('utf-8') for part in _PAGE_PLACEHOLDER_RE.split(xml_template)]
+    payload = b'1'.join(template_parts)
 
     # GET TOTAL PAGES ON THIS API CALL
     timeout = aiohttp.ClientTimeout(total=8000)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-
-        response = await _hit_wws(session=session, url=url, payload=payload)
-        try:
-            pages = int(
-                etree.fromstring(response).find('.//wd:Total_Pages', namespaces={'wd': 'urn:com.workday/bsvc'}).text)
-
-        except AttributeError:
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT_REQUESTS, limit_per_host=MAX_CONCURRENT_REQUESTS,
+                                     keepalive_timeout=75, ttl_dns_cache=300)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+
+        response = await _hit_wws(session=session, url=url, payload=payload, semaphore=semaphore)
+        pages = _total_pages(response)
+        if pages is None:
             msg = f'Exiting gracefully - Error finding pages in API call. Response: {str(response)[:2000]}'
             raise ValueError(msg)
 
@@ -101,24 +119,51 @@ async def _generate_requests(url: str, xml_template: str) -> list:
             msg = f'Too many pages to process. Please narrow your date range. Pages: {pages}, should be less that 8000'
             raise ValueError(msg)
 
+        # PAGE 1 WAS ALREADY PULLED TO GET THE TOTAL PAGES, ONLY REQUEST THE REST
         tasks = []
-        for number in range(1, pages + 1):
-            payload = xml_template.replace('{{ page }}', str(number))
-            payload = payload.replace('{ page }', str(number))
-            tasks.append(asyncio.ensure_future(_hit_wws(session, url, payload)))
+        for number in range(2, pages + 1):
+            payload = str(number).encode('utf-8').join(template_parts)
+            tasks.append(asyncio.ensure_future(_hit_wws(session, url, payload, semaphore)))
 
         web_calls = await asyncio.gather(*tasks)
-        return web_calls
+        return [response, *web_calls] if pages > 0 else []
+
+
+def _total_pages(response: bytes) -> int | None:
+    """
+    Get the total number of pages from the first response without parsing the whole document.
+    Scans the bytes for ``<wd:Total_Pages>``, falls back to iterparse if the namespace uses another prefix.
+
+    :param response: xml response
+    :return: total pages or None if the response does not contain it.
+    """
+    match = _TOTAL_PAGES_RE.search(response)
+    if match:
+        return int(match.group(1))
+
+    for _, elem in etree.iterparse(BytesIO(response), events=('end',), tag=_TOTAL_PAGES_TAG):
+        return int(elem.text)
+    return None
 
 
-async def _hit_wws(session: aiohttp.ClientSession, url: str, payload: str):
+async def _hit_wws(session: aiohttp.ClientSession, url: str, payload: bytes, semaphore: asyncio.Semaphore):
     """
-    Async function that hits the WWS API.
+    Async function that hits the WWS API. The semaphore caps the number of requests in flight, throttled (429) and
+    unavailable (503) responses are retried with jittered exponential backoff (or the Retry-After header).
 
     :param session:
     :param url:
     :param payload:
+    :param semaphore: limits concurrent requests to Workday.
     :return:
     """
-    async with session.post(url, headers={'Content-Type': 'application/xml'}, data=payload) as resp:
-        return await resp.read()
+    for attempt in range(MAX_RETRIES + 1):
+        async with semaphore:
+            async with session.post(url, headers={'Content-Type': 'application/xml'}, data=payload) as resp:
+                if resp.status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                    return await resp.read()
+                retry_after = resp.headers.get('Retry-After', '')
+
+        # WAIT OUTSIDE THE SEMAPHORE SO OTHER PAGES CAN KEEP GOING
+        delay = float(retry_after) if retry_after.isdigit() else 2 ** attempt * random.uniform(0.5, 1.5)
+        await asyncio.sleep(delay)